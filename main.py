@@ -1,83 +1,406 @@
+import io
 import os
-import shutil
+import gzip
+import asyncio
+import hashlib
 import tempfile
-import subprocess
-from pathlib import Path
-
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import av
+import brotli
 import numpy as np
+import pyworld as pw
+import soundfile as sf
+import torch
 import librosa
-from fastapi import FastAPI, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request, UploadFile, HTTPException
+from fastapi.responses import HTMLResponse, ORJSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from resemblyzer import VoiceEncoder, preprocess_wav
+from resemblyzer.hparams import (
+    mel_n_channels, mel_window_length, mel_window_step, partials_n_frames,
+)
 
 # ----------------- FastAPI setup -----------------
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_audio(load_encoder)
+    # Run one dummy forward so torch's lazy kernel/thread-pool setup happens
+    # before the first user request rather than during it.
+    await run_audio(embed_wavs, [np.zeros(2 * SAMPLE_RATE, dtype=np.float32)])
+    sweeper = asyncio.create_task(purge_caches()) if CACHE_TTL_SEC > 0 else None
+    yield
+    if sweeper is not None:
+        sweeper.cancel()
+    AUDIO_POOL.shutdown(wait=False)
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+SAMPLE_RATE = 16000
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "25")) << 20
+PITCH_SR = 8000
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+# Both samples plus multipart framing.
+MAX_REQUEST_BYTES = 2 * MAX_UPLOAD_BYTES + (1 << 16)
+
+
+class ContentLengthLimit:
+    # Plain ASGI middleware: refuses oversized bodies from the Content-Length
+    # header alone, before FastAPI reads and parses the multipart form.
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > self.max_bytes:
+                response = ORJSONResponse({"detail": "Upload too large"}, status_code=413)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(ContentLengthLimit, max_bytes=MAX_REQUEST_BYTES)
+# Added last so it is the outermost middleware: the 413 above still carries
+# CORS headers and reaches cross-origin clients as a 413, not a network error.
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # 🔒 restrict in production
-    allow_methods=["*"],
+    # 🔒 restrict in production, e.g. CORS_ORIGINS=https://doyoutrustmyvoice.com
+    allow_origins=os.getenv("CORS_ORIGINS", "*").split(","),
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
+    max_age=86400,  # let browsers reuse preflight answers for a day
 )
 
-encoder = VoiceEncoder()
+# Resemblyzer's mel front-end (25 ms window, 10 ms hop, 40 bands) with the
+# filterbank built once here rather than by librosa on every utterance.
+MEL_N_FFT = int(SAMPLE_RATE * mel_window_length / 1000)
+MEL_HOP = int(SAMPLE_RATE * mel_window_step / 1000)
+_MEL_FB = librosa.filters.mel(sr=SAMPLE_RATE, n_fft=MEL_N_FFT, n_mels=mel_n_channels).astype(np.float32)
+
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# Worker processes started by the entry point: a single process owns the
+# GPU, on CPU half the cores. Read here too so each worker can size itself.
+WORKERS = int(os.getenv("WEB_CONCURRENCY", 1 if DEVICE == "cuda" else max(1, (os.cpu_count() or 2) // 2)))
+# "torch" runs resemblyzer's model directly; "onnx" exports it once at startup
+# and runs an int8 ONNX Runtime session (needs the optional onnxruntime).
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+
+# Half precision halves the weight traffic on GPU; the CPU path stays FP32
+# (or int8, below) since CPUs have no fast FP16 LSTM kernels.
+ENCODER_DTYPE = torch.float16 if DEVICE == "cuda" else torch.float32
+
+
+def build_onnx_session(model: VoiceEncoder):
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32_path = os.path.join(tmp, "encoder.onnx")
+        int8_path = os.path.join(tmp, "encoder.int8.onnx")
+        dummy = torch.zeros(1, partials_n_frames, mel_n_channels, device=model.device)
+        torch.onnx.export(model, dummy, fp32_path, opset_version=17,
+                          input_names=["mels"], output_names=["embeds"],
+                          dynamic_axes={"mels": {0: "partials"}, "embeds": {0: "partials"}})
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider")
+                     if p in ort.get_available_providers()]
+        # Same per-worker share of the cores as torch, rather than ORT's
+        # default of every physical core in every worker.
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        return ort.InferenceSession(int8_path, sess_options=options, providers=providers)
+
+
+if DEVICE == "cpu":
+    # Every worker process runs its own intra-op pool, so split the cores
+    # between them instead of letting each one spawn cpu_count threads.
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // WORKERS))
+
+# Set by load_encoder() from lifespan, not at import: `python main.py` imports
+# this module twice (as __main__ and as main for uvicorn), and with several
+# workers the supervisor never serves a request, so neither should hold a model.
+encoder = None
+_ORT_SESSION = None
+_GPU_MEL = False
+
+
+def load_encoder():
+    global encoder, _ORT_SESSION, _GPU_MEL, _MEL_FB_T, _MEL_WINDOW_T
+    model = VoiceEncoder(device=DEVICE)
+    if ENCODER_BACKEND == "onnx":
+        _ORT_SESSION = build_onnx_session(model)
+    else:
+        model = model.to(ENCODER_DTYPE)
+        # int8 dynamic quantization of the LSTM/Linear layers; weights are
+        # quantized once, activations on the fly, and embeddings come out as
+        # float32. Dynamic quantization only has CPU kernels.
+        if DEVICE == "cpu" and os.getenv("QUANTIZE_ENCODER", "1") == "1":
+            if "fbgemm" in torch.backends.quantized.supported_engines:
+                torch.backends.quantized.engine = "fbgemm"
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8
+            )
+
+    # With the torch backend on GPU the mel front-end runs there too (same hann
+    # window, centering and filterbank as librosa.stft), so the waveform is the
+    # only thing copied to the device.
+    _GPU_MEL = DEVICE == "cuda" and _ORT_SESSION is None
+    if _GPU_MEL:
+        _MEL_FB_T = torch.from_numpy(_MEL_FB).to(DEVICE)
+        _MEL_WINDOW_T = torch.hann_window(MEL_N_FFT, device=DEVICE)
+    encoder = model
+
+
+# One encoder forward per process at a time: on GPU so requests can't exhaust
+# device memory, on CPU because a forward already uses this worker's whole
+# share of the cores. Decoding and analysis stay outside and keep overlapping.
+_ENCODER_SEM = asyncio.Semaphore(1)
+# Dedicated, bounded pool for decode/encoder/librosa work, so audio jobs
+# neither oversubscribe the CPU nor share threads with the loop's default
+# executor (used by Starlette for file and sync-handler offloads). Sized to
+# this worker's share of the cores, like torch's intra-op pool above.
+AUDIO_POOL = ThreadPoolExecutor(max_workers=max(2, (os.cpu_count() or 1) // WORKERS),
+                                thread_name_prefix="audio")
+
+# ----------------- Caches -----------------
+class LRUCache:
+    # Entries expire `ttl` seconds after they are stored; with ttl <= 0 the
+    # cache is disabled and nothing outlives the request.
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def purge(self):
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, (expires, _) in self._data.items() if expires < now]:
+                del self._data[key]
+
+
+# Per-sample results keyed by the BLAKE2b digest of the uploaded bytes. When
+# both are cached a resubmitted sample skips decoding, preprocessing, the
+# encoder and the librosa analysis, leaving a single dot product.
+# Embeddings are voice-derived data and a fast hit reveals that a clip was
+# seen recently, so caching is opt-in: CACHE_TTL_SEC=0 (default) keeps nothing.
+CACHE_TTL_SEC = int(os.getenv("CACHE_TTL_SEC", "0"))
+EMBED_CACHE_SIZE = 1024
+ANALYSIS_CACHE_SIZE = 1024
+_EMB_CACHE = LRUCache(EMBED_CACHE_SIZE, CACHE_TTL_SEC)
+_ANALYSIS_CACHE = LRUCache(ANALYSIS_CACHE_SIZE, CACHE_TTL_SEC)
+# Appended to the FAQ and privacy copy so the pages state the actual retention.
+RETENTION_NOTE = (
+    f" Derived voice features (never the audio itself) are kept in server memory"
+    f" for at most {-(-CACHE_TTL_SEC // 60)} minute(s) to speed up repeat comparisons."
+    if CACHE_TTL_SEC > 0 else ""
+)
 
-# ----------------- Helpers -----------------
-def save_upload(upload: UploadFile) -> str:
-    suffix = Path(upload.filename).suffix or ".bin"
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    try:
-        shutil.copyfileobj(upload.file, tmp)
-        tmp.flush()
-        tmp.close()
-        return tmp.name
-    except Exception:
-        tmp.close()
-        os.remove(tmp.name)
-        raise
 
+async def purge_caches():
+    # Expired entries are also refused on lookup; this sweep makes sure they
+    # don't linger in memory while no requests come in.
+    while True:
+        await asyncio.sleep(max(1, min(CACHE_TTL_SEC, 10)))
+        _EMB_CACHE.purge()
+        _ANALYSIS_CACHE.purge()
 
-def convert_to_wav(path: str) -> str:
-    out = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-    out.close()
-    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error",
-           "-y", "-i", path, "-ac", "1", "-ar", "16000", out.name]
+# ----------------- Helpers -----------------
+async def run_audio(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(AUDIO_POOL, fn, *args)
+
+
+async def read_upload(upload: UploadFile) -> tuple[bytes, bytes]:
+    # No Content-Type allowlist: clients label the same audio as audio/*,
+    # video/webm, application/ogg or octet-stream; decode() rejects anything
+    # that isn't audio with a 400.
+    # Starlette has already spooled the whole part by now (ContentLengthLimit
+    # is what rejects oversized requests early), so read it in one call -- a
+    # single thread hop once the spool is on disk -- and hash it once.
+    data = await upload.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Upload too large")
+    return data, hashlib.blake2b(data, digest_size=16).digest()
+
+
+def read_native(buf: bytes):
+    # WAV/FLAC/OGG that are already 16 kHz (e.g. produced by another pipeline
+    # or a previous run) are read by libsndfile directly, with no resampling.
     try:
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=400, detail=f"ffmpeg failed: {e}")
-    return out.name
-
-
-def compare_wavs(w1: str, w2: str) -> float:
-    wav1 = preprocess_wav(Path(w1))
-    wav2 = preprocess_wav(Path(w2))
-    emb1 = encoder.embed_utterance(wav1)
-    emb2 = encoder.embed_utterance(wav2)
-    return float(np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2)))
-
-
-def analyze_audio(file_path: str):
-    y, sr = librosa.load(file_path, sr=16000)
-
-    duration = librosa.get_duration(y=y, sr=sr)
-    intervals = librosa.effects.split(y, top_db=30)
-    speech_durations = [(e - s) / sr for s, e in intervals]
-    total_speech = sum(speech_durations)
+        with sf.SoundFile(io.BytesIO(buf)) as f:
+            if f.samplerate != SAMPLE_RATE:
+                return None
+            y = f.read(dtype="float32", always_2d=True)
+    except RuntimeError:
+        return None
+    return y.mean(axis=1) if y.shape[1] > 1 else y[:, 0]
+
+
+def decode(buf: bytes) -> np.ndarray:
+    y = read_native(buf)
+    if y is not None and y.size:
+        return y
+
+    # Decode and resample to 16 kHz mono float32 in-process with libav,
+    # instead of forking ffmpeg and round-tripping a WAV through disk.
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+    chunks = []
+    try:
+        with av.open(io.BytesIO(buf)) as container:
+            stream = container.streams.audio[0]
+            # Short clips decode fastest on one thread, and both uploads (plus
+            # other requests) are already decoded in parallel.
+            stream.codec_context.thread_count = 1
+            for frame in container.decode(stream):
+                chunks.extend(f.to_ndarray().ravel() for f in resampler.resample(frame))
+            chunks.extend(f.to_ndarray().ravel() for f in resampler.resample(None))
+    except (av.error.FFmpegError, IndexError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"decode failed: {e}")
+    if not chunks:
+        raise HTTPException(status_code=400, detail="decode failed: no audio")
+    return np.concatenate(chunks).astype(np.float32, copy=False)
+
+
+async def decode_if(buf: bytes, needed: bool):
+    # PyAV decoders are pinned to one thread each, so AUDIO_POOL's size is
+    # what bounds concurrent decodes in this worker.
+    return await run_audio(decode, buf) if needed else None
+
+
+def mel_spectrogram(wav: np.ndarray):
+    if _GPU_MEL:
+        spec = torch.stft(torch.from_numpy(wav).to(DEVICE), MEL_N_FFT, MEL_HOP,
+                          window=_MEL_WINDOW_T, center=True, pad_mode="constant",
+                          return_complex=True)
+        return (_MEL_FB_T @ spec.abs().pow(2)).T
+    power = np.abs(librosa.stft(wav, n_fft=MEL_N_FFT, hop_length=MEL_HOP)) ** 2
+    return (_MEL_FB @ power).T
+
+
+def encoder_forward(mels: list) -> np.ndarray:
+    if _ORT_SESSION is not None:
+        return _ORT_SESSION.run(None, {"mels": np.array(mels)})[0]
+    with torch.inference_mode():
+        batch = torch.stack(mels) if _GPU_MEL else torch.from_numpy(np.array(mels))
+        batch = batch.to(encoder.device, ENCODER_DTYPE)
+        return encoder(batch).float().cpu().numpy()
+
+
+def embed_wavs(wavs) -> np.ndarray:
+    # Same partial slicing and mean pooling as VoiceEncoder.embed_utterance,
+    # but the partials of every utterance go through a single forward pass.
+    mels, counts = [], []
+    for wav in wavs:
+        # rate/min_coverage are embed_utterance's defaults; the static method
+        # itself has none.
+        wav_slices, mel_slices = encoder.compute_partial_slices(len(wav), rate=1.3, min_coverage=0.75)
+        max_wave_length = wav_slices[-1].stop
+        if max_wave_length >= len(wav):
+            wav = np.pad(wav, (0, max_wave_length - len(wav)), "constant")
+        mel = mel_spectrogram(wav)
+        mels.extend(mel[s] for s in mel_slices)
+        counts.append(len(mel_slices))
+
+    partial_embeds = encoder_forward(mels)
+    embeds = np.stack([p.mean(axis=0) for p in np.split(partial_embeds, np.cumsum(counts)[:-1])])
+    return embeds / np.sqrt(np.einsum("ij,ij->i", embeds, embeds))[:, None]
+
+
+def get_embeddings(wavs, keys, embeds) -> list:
+    # `embeds` holds the cache lookups made by the caller; only the misses are
+    # preprocessed and encoded, still in a single forward pass.
+    missing = [i for i, emb in enumerate(embeds) if emb is None]
+    if missing:
+        fresh = embed_wavs([preprocess_wav(wavs[i]) for i in missing])
+        for i, emb in zip(missing, fresh):
+            embeds[i] = emb
+            _EMB_CACHE.put(keys[i], emb)
+    return embeds
+
+
+def compare_wavs(wavs, keys, embeds) -> float:
+    emb1, emb2 = get_embeddings(wavs, keys, embeds)
+    # embed_wavs returns L2-normalized vectors, so cosine is a plain dot.
+    sim = float(emb1 @ emb2)
+    # float32 rounding can push a near-identical pair just past 1.
+    return max(-1.0, min(1.0, sim))
+
+
+def mean_var(a: np.ndarray) -> tuple[float, float]:
+    # Sum and sum of squares (a single BLAS dot) instead of separate mean()
+    # and var() traversals, accumulated in the input's own dtype (float32 for
+    # RMS) rather than promoting to float64; empty input yields zeros.
+    if a.size == 0:
+        return 0.0, 0.0
+    mean = a.sum() / a.size
+    return float(mean), float(max(np.dot(a, a) / a.size - mean * mean, 0.0))
+
+
+def analyze_audio(y: np.ndarray, sr: int = SAMPLE_RATE):
+    duration = y.shape[0] / sr
+    # One RMS framing pass feeds both speech detection and the energy stats.
+    # Same rule as librosa.effects.split(top_db=30): a frame is speech when
+    # within 30 dB of the loudest one; a trailing speech frame is clipped to len(y).
+    rms = librosa.feature.rms(y=y, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH)[0]
+    speech = librosa.amplitude_to_db(rms, ref=np.max, top_db=None) > -30
+    speech_samples = int(np.count_nonzero(speech)) * HOP_LENGTH
+    if speech.size and speech[-1]:
+        speech_samples -= speech.size * HOP_LENGTH - y.shape[0]
+    total_speech = speech_samples / sr
     pause_ratio = (duration - total_speech) / duration if duration > 0 else 0
 
+    # WORLD's DIO + StoneMask: compiled, FFT-based, and it marks unvoiced
+    # frames with 0 so pitch statistics only cover voiced speech.
+    # Pitch stays below 300 Hz, so it is estimated on an 8 kHz copy (half the
+    # samples); energy and speech detection keep the full-rate signal.
     try:
-        f0 = librosa.yin(y, fmin=50, fmax=300)
-        mean_pitch = float(np.nanmean(f0))
-        pitch_var = float(np.nanstd(f0))
+        x = librosa.resample(y, orig_sr=sr, target_sr=PITCH_SR, res_type="polyphase").astype(np.float64)
+        f0, t = pw.dio(x, PITCH_SR, f0_floor=50, f0_ceil=300, frame_period=20.0)
+        f0 = pw.stonemask(x, f0, t, PITCH_SR)
+        voiced = f0[f0 > 0]
     except Exception:
-        mean_pitch, pitch_var = 0.0, 0.0
+        voiced = np.empty(0)
+    # No voiced frames (silence, noise, whisper): there is no pitch to report,
+    # rather than a 0 that would read as perfectly monotone.
+    if voiced.size:
+        mean_pitch, pitch_var = mean_var(voiced)
+        pitch_var = pitch_var ** 0.5
+    else:
+        mean_pitch, pitch_var = None, None
 
-    rms = librosa.feature.rms(y=y)[0]
-    mean_energy = float(np.mean(rms))
-    energy_var = float(np.var(rms))
+    mean_energy, energy_var = mean_var(rms)
 
     metrics = {
         "duration_sec": duration,
@@ -92,11 +415,32 @@ def analyze_audio(file_path: str):
     return {**metrics, **rate_suspicion(metrics)}
 
 
+def analyze_and_cache(y: np.ndarray, key: bytes):
+    analysis = analyze_audio(y)
+    _ANALYSIS_CACHE.put(key, analysis)
+    return analysis
+
+
+async def get_analysis(y, key: bytes, cached):
+    if cached is not None:
+        return cached
+    return await run_audio(analyze_and_cache, y, key)
+
+
+async def score_pair(wavs, keys, embeds) -> float:
+    # Both embeddings cached: only a dot product is left, so don't queue it
+    # behind other requests' encoder forwards (or hop to a thread at all).
+    if all(emb is not None for emb in embeds):
+        return compare_wavs(wavs, keys, embeds)
+    async with _ENCODER_SEM:
+        return await run_audio(compare_wavs, wavs, keys, embeds)
+
+
 def rate_suspicion(metrics):
     flags = []
     if metrics["speech_ratio"] < 0.4 or metrics["speech_ratio"] > 0.95:
         flags.append("Unnatural speech/pause ratio")
-    if metrics["pitch_variation"] < 10:
+    if metrics["pitch_variation"] is not None and metrics["pitch_variation"] < 10:
         flags.append("Monotone pitch (possible synthetic)")
     if metrics["energy_variation"] < 1e-5:
         flags.append("Flat energy (possible normalization)")
@@ -111,6 +455,46 @@ def rate_suspicion(metrics):
     return {"suspicion": suspicion, "flags": flags}
 
 
+def precompress(text: str) -> dict:
+    # Static bodies are encoded, compressed and hashed once at import, so
+    # serving them costs no per-request encoding or compression CPU.
+    body = text.encode("utf-8")
+    # mtime=0 keeps the gzip header (and so its ETag) identical across
+    # restarts and worker processes.
+    variants = {
+        "br": brotli.compress(body, quality=11),
+        "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+        "identity": body,
+    }
+    # Tiny bodies like robots.txt come out larger once compressed; only keep
+    # encodings that actually save bytes.
+    return {enc: (data, f'"{hashlib.sha1(data).hexdigest()}"') for enc, data in variants.items()
+            if enc == "identity" or len(data) < len(body)}
+
+
+def encoded_response(request: Request, variants: dict, media_type: str) -> Response:
+    accepted = set()
+    for token in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = token.partition(";")
+        # "br;q=0" means the client refuses br; any other weight accepts it.
+        params = params.replace(" ", "").lower()
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    encoding = next((e for e in ("br", "gzip") if e in accepted and e in variants), "identity")
+    body, etag = variants[encoding]
+    headers = {"cache-control": "public, max-age=3600", "vary": "Accept-Encoding", "etag": etag}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["content-encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
 # ----------------- Routes -----------------
 @app.get("/healthz")
 def healthz():
@@ -119,34 +503,46 @@ def healthz():
 
 @app.post("/compare")
 async def compare(file1: UploadFile, file2: UploadFile):
-    p1 = p2 = w1 = w2 = None
-    try:
-        p1 = save_upload(file1)
-        p2 = save_upload(file2)
-        w1 = convert_to_wav(p1)
-        w2 = convert_to_wav(p2)
-
-        score = compare_wavs(w1, w2)
-        analysis1 = analyze_audio(w1)
-        analysis2 = analyze_audio(w2)
-
-        return JSONResponse({
-            "similarity": score,
-            "analysis_sample1": analysis1,
-            "analysis_sample2": analysis2
+    (d1, k1), (d2, k2) = await asyncio.gather(read_upload(file1), read_upload(file2))
+
+    if k1 == k2:
+        # The same bytes twice: the score is 1 by definition, so skip the
+        # encoder and analyse the clip once.
+        analysis = _ANALYSIS_CACHE.get(k1)
+        if analysis is None:
+            y = await decode_if(d1, True)
+            analysis = await get_analysis(y, k1, None)
+        return ORJSONResponse({
+            "similarity": 1.0,
+            "analysis_sample1": analysis,
+            "analysis_sample2": analysis
         })
-    finally:
-        for f in [p1, p2, w1, w2]:
-            if f and os.path.exists(f):
-                try:
-                    os.remove(f)
-                except Exception:
-                    pass
 
+    keys = [k1, k2]
+    embeds = [_EMB_CACHE.get(k) for k in keys]
+    analyses = [_ANALYSIS_CACHE.get(k) for k in keys]
 
-@app.get("/", response_class=HTMLResponse)
-def frontend():
-    return """
+    wavs = await asyncio.gather(
+        decode_if(d1, embeds[0] is None or analyses[0] is None),
+        decode_if(d2, embeds[1] is None or analyses[1] is None),
+    )
+
+    # The encoder and both librosa analyses run in worker threads at once;
+    # torch, NumPy and libav release the GIL in their kernels.
+    score, analysis1, analysis2 = await asyncio.gather(
+        score_pair(wavs, keys, embeds),
+        get_analysis(wavs[0], k1, analyses[0]),
+        get_analysis(wavs[1], k2, analyses[1]),
+    )
+
+    return ORJSONResponse({
+        "similarity": score,
+        "analysis_sample1": analysis1,
+        "analysis_sample2": analysis2
+    })
+
+
+_INDEX_HTML = precompress("""
 <!doctype html>
 <html lang="en">
 <head>
@@ -215,7 +611,7 @@ def frontend():
 
     <section class="faq">
       <h2>❓ FAQ</h2>
-      <p><strong>Is my voice stored?</strong><br>No. All audio is deleted immediately after analysis.</p>
+      <p><strong>Is my voice stored?</strong><br>No. All audio is deleted immediately after analysis.<!--retention--></p>
       <p><strong>Where is the processing done?</strong><br>In London (UK), fully GDPR compliant.</p>
       <p><strong>How accurate is this tool?</strong><br>We provide a similarity score and speech analysis. Use results as guidance, not proof.</p>
       <p><strong>Which formats are supported?</strong><br>WAV, MP3, OGG, WEBM.</p>
@@ -238,14 +634,22 @@ def frontend():
 const recorders = {};
 const timers = {};
 const MAX_DURATION = 30; // seconds
+const $ = id => document.getElementById(id);
+const overlay = $("overlay"), overlayTitle = $("overlay-title"),
+      overlayText = $("overlay-text"), overlayClose = $("overlay-close");
 
+let mimeChoice = null;
 function pickMime() {
-  if (MediaRecorder.isTypeSupported("audio/webm;codecs=opus")) return {mime:"audio/webm;codecs=opus", ext:".webm"};
-  if (MediaRecorder.isTypeSupported("audio/ogg;codecs=opus")) return {mime:"audio/ogg;codecs=opus", ext:".ogg"};
-  return {mime:"", ext:".bin"};
+  // MediaRecorder support doesn't change while the page is open.
+  if (mimeChoice) return mimeChoice;
+  if (MediaRecorder.isTypeSupported("audio/webm;codecs=opus")) mimeChoice = {mime:"audio/webm;codecs=opus", ext:".webm"};
+  else if (MediaRecorder.isTypeSupported("audio/ogg;codecs=opus")) mimeChoice = {mime:"audio/ogg;codecs=opus", ext:".ogg"};
+  else mimeChoice = {mime:"", ext:".bin"};
+  return mimeChoice;
 }
 
 function startRecording(id) {
+  const status = $(id + "-status"), preview = $(id + "-preview");
   navigator.mediaDevices.getUserMedia({ audio: true }).then(stream => {
     const {mime, ext} = pickMime();
     const rec = new MediaRecorder(stream, mime ? {mimeType: mime} : {});
@@ -257,23 +661,23 @@ function startRecording(id) {
       const audio = document.createElement("audio");
       audio.controls = true;
       audio.src = URL.createObjectURL(blob);
-      document.getElementById(id + "-preview").innerHTML = "";
-      document.getElementById(id + "-preview").appendChild(audio);
+      preview.innerHTML = "";
+      preview.appendChild(audio);
       stream.getTracks().forEach(t => t.stop());
       clearInterval(timers[id]);
-      document.getElementById(id + "-status").innerText = "";
+      status.innerText = "";
     };
     rec.start();
     recorders[id] = {recorder: rec};
 
     let seconds = 0;
-    document.getElementById(id + "-status").innerText = "Recording: 0s";
+    status.innerText = "Recording: 0s";
     timers[id] = setInterval(() => {
       seconds++;
       if (seconds >= MAX_DURATION) {
         stopRecording(id);
       } else {
-        document.getElementById(id + "-status").innerText = "Recording: " + seconds + "s";
+        status.innerText = "Recording: " + seconds + "s";
       }
     }, 1000);
 
@@ -288,10 +692,10 @@ function stopRecording(id) {
 }
 
 function openOverlay() {
-  document.getElementById("overlay-title").innerText = "⏳ Comparing…";
-  document.getElementById("overlay-text").innerText = "Please wait...";
-  document.getElementById("overlay-close").style.display = "none";
-  document.getElementById("overlay").style.display = "flex";
+  overlayTitle.innerText = "⏳ Comparing…";
+  overlayText.innerText = "Please wait...";
+  overlayClose.style.display = "none";
+  overlay.style.display = "flex";
 }
 function updateOverlay(data) {
   const verdict = data.similarity > 0.9 ? "✅ Great match"
@@ -302,15 +706,15 @@ function updateOverlay(data) {
   txt += "Flags: " + data.analysis_sample1.flags.join(", ") + "\\n\\n";
   txt += "Sample 2 suspicion: " + data.analysis_sample2.suspicion + "\\n";
   txt += "Flags: " + data.analysis_sample2.flags.join(", ");
-  document.getElementById("overlay-title").innerText = verdict;
-  document.getElementById("overlay-text").innerText = txt;
-  document.getElementById("overlay-close").style.display = "inline-block";
+  overlayTitle.innerText = verdict;
+  overlayText.innerText = txt;
+  overlayClose.style.display = "inline-block";
 }
-function closeOverlay() { document.getElementById("overlay").style.display = "none"; }
+function closeOverlay() { overlay.style.display = "none"; }
 
 async function submitForm() {
-  let f1 = document.getElementById("file1").files[0] || recorders["rec1"]?.file;
-  let f2 = document.getElementById("file2").files[0] || recorders["rec2"]?.file;
+  let f1 = $("file1").files[0] || recorders["rec1"]?.file;
+  let f2 = $("file2").files[0] || recorders["rec2"]?.file;
   if (!f1 || !f2) { alert("Please provide both samples."); return; }
   openOverlay();
   let fd = new FormData();
@@ -320,20 +724,23 @@ async function submitForm() {
     if (!resp.ok) throw new Error("Server error " + resp.status);
     updateOverlay(await resp.json());
   } catch (err) {
-    document.getElementById("overlay-title").innerText = "❌ Error";
-    document.getElementById("overlay-text").innerText = err.message;
-    document.getElementById("overlay-close").style.display = "inline-block";
+    overlayTitle.innerText = "❌ Error";
+    overlayText.innerText = err.message;
+    overlayClose.style.display = "inline-block";
   }
 }
 </script>
 </body>
 </html>
-    """
+    """.replace("<!--retention-->", RETENTION_NOTE))
 
 
-@app.get("/privacy", response_class=HTMLResponse)
-def privacy():
-    return """
+@app.get("/", response_class=HTMLResponse)
+def frontend(request: Request):
+    return encoded_response(request, _INDEX_HTML, "text/html")
+
+
+_PRIVACY_HTML = precompress("""
 <!doctype html>
 <html lang="en">
 <head>
@@ -353,31 +760,46 @@ def privacy():
     <h1>Privacy & Legal Disclaimer</h1>
   </header>
   <main>
-    <p>We process audio only to compare similarity and analyze speech. Files are <strong>deleted immediately</strong> after processing. Data is processed in <strong>London (UK)</strong> and complies with <strong>GDPR</strong>.</p>
+    <p>We process audio only to compare similarity and analyze speech. Files are <strong>deleted immediately</strong> after processing.<!--retention--> Data is processed in <strong>London (UK)</strong> and complies with <strong>GDPR</strong>.</p>
     <p>By using this service, you consent to this temporary processing. Results are provided "as is" without warranty. You are responsible for how they are used.</p>
   </main>
 </body>
 </html>
-    """
+    """.replace("<!--retention-->", RETENTION_NOTE))
+
+
+@app.get("/privacy", response_class=HTMLResponse)
+def privacy(request: Request):
+    return encoded_response(request, _PRIVACY_HTML, "text/html")
 
 
-@app.get("/sitemap.xml", response_class=HTMLResponse)
-def sitemap():
-    return """<?xml version="1.0" encoding="UTF-8"?>
+_SITEMAP_XML = precompress("""<?xml version="1.0" encoding="UTF-8"?>
 <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
   <url><loc>https://doyoutrustmyvoice.com/</loc><changefreq>weekly</changefreq><priority>1.0</priority></url>
   <url><loc>https://doyoutrustmyvoice.com/privacy</loc><changefreq>yearly</changefreq><priority>0.5</priority></url>
 </urlset>
-"""
+""")
+
+
+@app.get("/sitemap.xml", response_class=Response)
+def sitemap(request: Request):
+    return encoded_response(request, _SITEMAP_XML, "application/xml")
 
 
-@app.get("/robots.txt", response_class=HTMLResponse)
-def robots():
-    return """User-agent: *
+_ROBOTS_TXT = precompress("""User-agent: *
 Allow: /
 Sitemap: https://doyoutrustmyvoice.com/sitemap.xml
-"""
+""")
+
+
+@app.get("/robots.txt", response_class=PlainTextResponse)
+def robots(request: Request):
+    return encoded_response(request, _ROBOTS_TXT, "text/plain")
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    # A single worker serves this module's own app; an import string (and so
+    # a second import as `main`) is only needed to spawn worker processes.
+    uvicorn.run(app if WORKERS == 1 else "main:app", host="0.0.0.0", port=8080,
+                loop="uvloop", http="httptools", workers=WORKERS,
+                limit_concurrency=int(os.getenv("LIMIT_CONCURRENCY", "0")) or None)
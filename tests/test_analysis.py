@@ -0,0 +1,25 @@
+import librosa
+import numpy as np
+import pytest
+
+import main
+
+
+def tone(seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * main.SAMPLE_RATE)) / main.SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 180 * t)).astype(np.float32)
+
+
+def silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * main.SAMPLE_RATE), dtype=np.float32)
+
+
+# Lengths are deliberately not multiples of HOP_LENGTH so the trailing-frame
+# clipping is exercised.
+@pytest.mark.parametrize("y", [
+    np.concatenate([silence(0.7), tone(1.23), silence(0.41), tone(0.9133)]),   # ends in speech
+    np.concatenate([tone(0.85), silence(0.52), tone(1.07), silence(0.6611)]),  # ends in silence
+], ids=["ends-in-speech", "ends-in-silence"])
+def test_speech_ratio_matches_effects_split(y):
+    expected = sum(e - s for s, e in librosa.effects.split(y, top_db=30)) / y.shape[0]
+    assert main.analyze_audio(y)["speech_ratio"] == pytest.approx(expected, abs=1e-9)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from resemblyzer import VoiceEncoder
+
+import main
+
+
+@pytest.fixture(scope="module", autouse=True)
+def loaded_encoder():
+    # The app builds its encoder in lifespan; outside a server do it here.
+    if main.encoder is None:
+        main.load_encoder()
+
+
+@pytest.fixture(scope="module")
+def reference():
+    # Plain FP32 CPU encoder; main's may be int8, FP16 or ONNX, hence the
+    # tolerance below rather than exact equality.
+    return VoiceEncoder(device="cpu", verbose=False)
+
+
+def make_wav(seconds: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * main.SAMPLE_RATE)) / main.SAMPLE_RATE
+    tone = np.sin(2 * np.pi * 140 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    return (0.3 * tone + 0.02 * rng.standard_normal(t.size)).astype(np.float32)
+
+
+@pytest.mark.parametrize("seconds", [0.5, 1.6, 4.0])
+def test_embed_wavs_matches_embed_utterance(reference, seconds):
+    wav = make_wav(seconds, seed=0)
+    ours = main.embed_wavs([wav])[0]
+    ref = reference.embed_utterance(wav)
+    assert np.isclose(np.linalg.norm(ours), 1.0, atol=1e-4)
+    assert float(ours @ ref) > 0.99
+
+
+def test_embed_wavs_batch_matches_single(reference):
+    wavs = [make_wav(1.0, seed=1), make_wav(3.0, seed=2)]
+    batched = main.embed_wavs(wavs)
+    for wav, emb in zip(wavs, batched):
+        assert float(emb @ reference.embed_utterance(wav)) > 0.99